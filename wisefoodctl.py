@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import argparse
+import functools
 import json
-import shutil
+import os
+import platform
 import subprocess
 import sys
 from pathlib import Path
-from typing import List, Optional
-from kubernetes import client, config
-import string
-import random
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 import textwrap
-import base64
+
+if TYPE_CHECKING:
+    from kubernetes import client
 
 REPO_ROOT = Path(__file__).resolve().parent
 ENV_DIR = REPO_ROOT / "environments"
@@ -34,6 +35,16 @@ INSTALLATION_URLS = {
         "https://github.com/jsonnet-bundler/jsonnet-bundler/releases/latest/download/jb-linux-arm",
         "https://github.com/jsonnet-bundler/jsonnet-bundler/releases/latest/download/jb-linux-arm64",
     ],
+    "helm": "https://raw.githubusercontent.com/helm/helm/main/scripts/get-helm-3",
+}
+
+YES_ANSWERS = frozenset({"y", "yes"})
+NO_ANSWERS = frozenset({"n", "no"})
+
+# binary name -> (display name, version flag); URLs come from INSTALLATION_URLS
+BINARY_INSTALLERS = {
+    "tk": ("Tanka", "version"),
+    "jb": ("Jsonnet Bundler", "--version"),
 }
 
 
@@ -53,31 +64,71 @@ def warning(msg: str):
 def verify_choice(prompt: str) -> bool:
     while True:
         choice = input(f"{prompt} [y/n]: ").strip().lower()
-        if choice in ["y", "yes"]:
+        if choice in YES_ANSWERS:
             return True
-        elif choice in ["n", "no"]:
+        if choice in NO_ANSWERS:
             return False
-        else:
-            print("Please enter 'y' or 'n'.")
+        print("Please enter 'y' or 'n'.")
 
 
 def run(
-    cmd: List[str],
+    cmd: List[Union[str, os.PathLike]],
     check: bool = True,
     interactive: bool = False,
     cwd: Optional[Path] = None,
+    tag: Optional[str] = None,
 ) -> int:
-    print("→", " ".join(cmd), file=sys.stderr)
+    cmd_line = " ".join(os.fspath(x) for x in cmd)
+    print("→", cmd_line, file=sys.stderr)
     stdin = None if interactive else subprocess.DEVNULL
-    rc = subprocess.run(cmd, stdin=stdin, cwd=cwd).returncode
+    if tag is None:
+        rc = subprocess.run(cmd, stdin=stdin, cwd=cwd).returncode
+    else:
+        # Prefix each output line so commands running side by side stay readable.
+        with subprocess.Popen(
+            cmd,
+            stdin=stdin,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        ) as proc:
+            for line in proc.stdout:
+                print(f"[{tag}] {line}", end="")
+        rc = proc.returncode
     if check and rc != 0:
-        error(f"Command failed with exit code {rc}: {' '.join(cmd)}")
+        error(f"Command failed with exit code {rc}: {cmd_line}")
     return rc
 
 
-def get_os_arch() -> str:
-    import platform
+@functools.cache
+def _tools_on_path() -> frozenset[str]:
+    """Return the TOOLS commands found on PATH, walking each PATH entry once.
 
+    Only names listed in TOOLS are looked for; anything else is never reported.
+    """
+    wanted = set(TOOLS.values())
+    found = set()
+    for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        if not d:
+            continue
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    # Only stat entries whose name we are looking for.
+                    if (
+                        e.name in wanted
+                        and e.is_file()
+                        and os.access(e.path, os.X_OK)
+                    ):
+                        found.add(e.name)
+        except OSError:
+            pass
+    return frozenset(found)
+
+
+@functools.cache
+def get_os_arch() -> str:
     os_name = platform.system().lower()
     arch = platform.machine().lower()
     if os_name == "linux":
@@ -96,48 +147,53 @@ def get_os_arch() -> str:
 # ---------------------------
 
 
-def install_tanka(dest: str = "/usr/local/bin/tk", force: bool = False):
-    arch = get_os_arch()
-    if shutil.which("tk") and not force:
-        info("tk already present; use --force to reinstall.")
-        return
+def download(url: str, suffix: str = "") -> Path:
+    """Download url to a temporary file and return its path."""
+    import tempfile
+    import urllib.request
 
-    url = (
-        INSTALLATION_URLS["tk_amd64"]
-        if arch == "amd64"
-        else INSTALLATION_URLS["tk_arm64"][1]
-    )
-    run(["sudo", "curl", "-fsSL", "-o", dest, url], interactive=True)
-    run(["sudo", "chmod", "a+x", dest], interactive=True)
-    run(["tk", "version"], check=False)
-    info("Tanka installed.")
+    info(f"Downloading {url}")
+    fd, tmp = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        urllib.request.urlretrieve(url, tmp)
+    except OSError as e:
+        os.unlink(tmp)
+        error(f"Failed to download {url}: {e}")
+    return Path(tmp)
 
 
-def install_jb(dest: str = "/usr/local/bin/jb", force: bool = False):
+def install_bin(name: str, dest: Optional[str] = None, force: bool = False):
+    label, version_flag = BINARY_INSTALLERS[name]
+    dest = dest or f"/usr/local/bin/{name}"
     arch = get_os_arch()
-    if shutil.which("jb") and not force:
-        info("jb already present; use --force to reinstall.")
+    if name in _tools_on_path() and not force:
+        info(f"{name} already present; use --force to reinstall.")
         return
 
     url = (
-        INSTALLATION_URLS["jb_amd64"]
+        INSTALLATION_URLS[f"{name}_amd64"]
         if arch == "amd64"
-        else INSTALLATION_URLS["jb_arm64"][1]
+        else INSTALLATION_URLS[f"{name}_arm64"][1]
     )
-    run(["sudo", "curl", "-fsSL", "-o", dest, url], interactive=True)
-    run(["sudo", "chmod", "a+x", dest], interactive=True)
-    run(["jb", "--version"], check=False)
-    info("Jsonnet Bundler installed.")
+    tmp = download(url)
+    try:
+        run(["sudo", "install", "-m", "0755", tmp, dest], interactive=True)
+    finally:
+        tmp.unlink(missing_ok=True)
+    _tools_on_path.cache_clear()
+    run([name, version_flag], check=False)
+    info(f"{label} installed.")
 
 
 def install_helm():
     # Uses official Helm install script; it invokes sudo if needed.
-    cmd = [
-        "bash",
-        "-lc",
-        "curl -fsSL https://raw.githubusercontent.com/helm/helm/main/scripts/get-helm-3 | bash",
-    ]
-    run(cmd, interactive=True)
+    script = download(INSTALLATION_URLS["helm"], suffix=".sh")
+    try:
+        run(["bash", script], interactive=True)
+    finally:
+        script.unlink(missing_ok=True)
+    _tools_on_path.cache_clear()
     run(["helm", "version"], check=False)
     info("Helm installed.")
 
@@ -147,21 +203,52 @@ def install_helm():
 # ---------------------------
 
 
+def _env_paths(env_name: str) -> Tuple[Path, Path, Path]:
+    """Return the directory, spec.json and main.jsonnet paths of an environment."""
+    env_dir = ENV_DIR / env_name
+    return env_dir, env_dir / "spec.json", env_dir / "main.jsonnet"
+
+
 def load_yaml(yaml_path: Path) -> dict:
     import yaml
 
-    with open(yaml_path, "r") as f:
-        return yaml.safe_load(f)
+    # Prefer the libyaml-backed loader when PyYAML was built with it.
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader
+
+    with open(yaml_path, "rb") as f:
+        return yaml.load(f, Loader=Loader)
 
 
 def generate_random_string(length=40, chunk_size=8, separator="-"):
-    characters = string.ascii_letters + string.digits
-    raw_string = "".join(random.choices(characters, k=length))
-    chunks = [raw_string[i : i + chunk_size] for i in range(0, length, chunk_size)]
-    return separator.join(chunks)
+    import secrets
+
+    # token_urlsafe yields ~1.3 chars per byte; fold "-"/"_" into letters so
+    # the separator stays unambiguous.
+    raw_string = (
+        secrets.token_urlsafe(length)[:length].replace("_", "a").replace("-", "b")
+    )
+    return separator.join(
+        raw_string[i : i + chunk_size] for i in range(0, length, chunk_size)
+    )
 
 
-def create_and_apply_k8s_secret(secret_name: str, namespace: str, data_dict: dict):
+@functools.cache
+def _k8s_core_api() -> client.CoreV1Api:
+    from kubernetes import client, config
+
+    config.load_kube_config()
+    return client.CoreV1Api()
+
+
+def create_and_apply_k8s_secret(
+    secret_name: str,
+    namespace: str,
+    data_dict: dict,
+    v1: Optional[client.CoreV1Api] = None,
+):
     """
     Creates a Kubernetes secret and applies it to the cluster.
 
@@ -169,24 +256,22 @@ def create_and_apply_k8s_secret(secret_name: str, namespace: str, data_dict: dic
         secret_name (str): Name of the secret.
         namespace (str): Kubernetes namespace.
         data_dict (dict): Dictionary containing secret data.
+        v1 (CoreV1Api, optional): API client to use; a shared one is created if omitted.
     """
-    # Encode data to base64 as required by Kubernetes secrets
-    encoded_data = {
-        k: base64.b64encode(v.encode("utf-8")).decode("utf-8")
-        for k, v in data_dict.items()
-    }
+    from kubernetes import client
 
     # Define the secret structure
     secret = client.V1Secret(
         api_version="v1",
         kind="Secret",
         metadata=client.V1ObjectMeta(name=secret_name, namespace=namespace),
-        data=encoded_data,
+        # stringData takes plain values; the API server base64-encodes them
+        string_data=data_dict,
         type="Opaque",
     )
     # Apply the secret to the Kubernetes cluster
-    config.load_kube_config()
-    v1 = client.CoreV1Api()
+    if v1 is None:
+        v1 = _k8s_core_api()
     try:
         v1.create_namespaced_secret(namespace=namespace, body=secret)
         info(f"Secret '{secret_name}' applied successfully.")
@@ -260,7 +345,7 @@ def generate_env_main(env_name, env_spec):
     elif env_spec["platform"] == "minikube" or "okeanos":
         dynamic_storage_class = "longhorn"
         provisioning_storage_class = "csi-hostpath-sc"
-    path = ENV_DIR / env_name / "main.jsonnet"
+    _, _, path = _env_paths(env_name)
 
     jsonnet_content = textwrap.dedent(
         f"""
@@ -387,41 +472,44 @@ def generate_env_main(env_name, env_spec):
     info(f"Environment {env_name}, main.jsonnet file updated")     
 
 def generate_spec_json(env_name: str, env_spec: dict):
-    path = ENV_DIR / env_name / "spec.json"
-    with open(path, "r") as spec_file:
-        spec_data = json.load(spec_file)
-    spec_data["metadata"]["namespace"] = str(ENV_DIR / env_name / "main.jsonnet")
-    spec_data["spec"]["injectLabels"] = True
-    spec_data["spec"]["resourceDefaults"]["annotations"] = {
-        "wisefood.eu/author": env_spec["author"]
-    }
-    spec_data["spec"]["resourceDefaults"]["labels"] = {
-        "app.kubernetes.io/managed-by": "tanka",
-        "app.kubernetes.io/part-of": "wisefood",
-        "wisefood.deployment": "main",
+    env_dir, path, main_path = _env_paths(env_name)
+    # Same layout `tk env add` produces, with our labels and annotations
+    spec_data = {
+        "apiVersion": "tanka.dev/v1alpha1",
+        "kind": "Environment",
+        "metadata": {
+            "name": str(env_dir.relative_to(REPO_ROOT)),
+            "namespace": str(main_path),
+        },
+        "spec": {
+            "contextNames": [env_spec["k8s_context"]],
+            "namespace": env_spec["namespace"],
+            "resourceDefaults": {
+                "annotations": {"wisefood.eu/author": env_spec["author"]},
+                "labels": {
+                    "app.kubernetes.io/managed-by": "tanka",
+                    "app.kubernetes.io/part-of": "wisefood",
+                    "wisefood.deployment": "main",
+                },
+            },
+            "expectVersions": {},
+            "injectLabels": True,
+        },
     }
-
     with open(path, "w") as json_file:
         json.dump(spec_data, json_file, indent=2)
 
-    info(f"Environment {env_name}, spec.json file updated")
+    info(f"Environment {env_name}, spec.json file written")
 
 
 def generate_env(env_name, env_spec):
-    # Generate the tanka env structure
-    run(
-        [
-            "tk",
-            "env",
-            "add",
-            str(ENV_DIR / env_name),
-            "--context-name",
-            env_spec["k8s_context"],
-            "--namespace",
-            env_spec["namespace"],
-        ],
-        check=True,
-    )
+    """Generate the tanka env structure without shelling out to `tk env add`."""
+    env_dir, _, main_path = _env_paths(env_name)
+    env_dir.mkdir(parents=True, exist_ok=True)
+    generate_spec_json(env_name, env_spec)
+    # Placeholder until generate_env_main writes the real one
+    if not main_path.exists():
+        main_path.write_text("{}\n")
 
 
 def generate_secrets(env_spec: dict):
@@ -431,14 +519,29 @@ def generate_secrets(env_spec: dict):
     Args:
         env_spec (dict): The environment specification containing secrets and namespace.
     """
+    from concurrent.futures import ThreadPoolExecutor
+
     namespace = env_spec.get("namespace", "default")
-    secrets = env_spec.get("secrets", {})
-    for secret in secrets:
-        for secret_name, secret_value in secret.items():
-            create_and_apply_k8s_secret(
-                secret_name=secret_name,
-                namespace=namespace,
-                data_dict={"password": secret_value},
+    pairs = [
+        (secret_name, secret_value)
+        for secret in env_spec.get("secrets", {})
+        for secret_name, secret_value in secret.items()
+    ]
+    if pairs:
+        # Load the kube config once and share the client; the creates are
+        # independent API calls, so issue them concurrently.
+        v1 = _k8s_core_api()
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            list(
+                ex.map(
+                    lambda item: create_and_apply_k8s_secret(
+                        secret_name=item[0],
+                        namespace=namespace,
+                        data_dict={"password": item[1]},
+                        v1=v1,
+                    ),
+                    pairs,
+                )
             )
     info(f"Secrets for namespace '{namespace}' have been generated and applied.")
 
@@ -453,7 +556,7 @@ def create_env(config_yaml_path: str, force: bool = False):
             f"Could not parse deployment configuration file or generate environment: {e}"
         )
 
-    path = ENV_DIR / env_name
+    path, _, _ = _env_paths(env_name)
     if path.exists() and any(path.iterdir()) and not force:
         error(
             f"Environment '{env_name}' already exists at {path} and contains files. Use --force carefully if want to overwrite it."
@@ -461,7 +564,6 @@ def create_env(config_yaml_path: str, force: bool = False):
     path.mkdir(parents=True, exist_ok=force)
     generate_env(env_name, env_spec)
     info(f"Environment '{env_name}' created at {path}")
-    generate_spec_json(env_name, env_spec)
     generate_secrets(env_spec)
     generate_env_main(env_name, env_spec)
 
@@ -478,7 +580,8 @@ def setup_dir_structure():
 
 
 def validate_tools():
-    missing_tools = [name for name, cmd in TOOLS.items() if shutil.which(cmd) is None]
+    present = _tools_on_path()
+    missing_tools = [name for name, cmd in TOOLS.items() if cmd not in present]
     if missing_tools:
         error(f"Missing required tools: {', '.join(missing_tools)}")
 
@@ -499,24 +602,27 @@ def validate_setup():
 def list_envs() -> List[str]:
     if not ENV_DIR.exists():
         return []
-    envs = []
-    for p in sorted(ENV_DIR.iterdir()):
-        if p.is_dir() and (p / "spec.json").exists():
-            envs.append(p.name)
-    return envs
+    # DirEntry.is_dir() reuses the file type from the directory listing.
+    with os.scandir(ENV_DIR) as it:
+        dirs = [e for e in it if e.is_dir()]
+    return sorted(
+        e.name for e in dirs if os.path.isfile(os.path.join(e.path, "spec.json"))
+    )
 
 
-def deps_update():
+def deps_update(tag: Optional[str] = None):
     validate_tools()
-    run(["jb", "update"], cwd=REPO_ROOT)
+    run(["jb", "update"], cwd=REPO_ROOT, tag=tag)
 
 
-def deps_vendor():
+def deps_vendor(tag: Optional[str] = None):
     validate_tools()
-    run(["tk", "tool", "charts", "vendor"], cwd=REPO_ROOT)
+    run(["tk", "tool", "charts", "vendor"], cwd=REPO_ROOT, tag=tag)
 
 
 def hard_init():
+    from concurrent.futures import ThreadPoolExecutor
+
     warning(
         "This will initialize the deployment setup and install required tools, potentially overwriting existing configurations."
     )
@@ -524,11 +630,25 @@ def hard_init():
         info("Aborted.")
         return
     setup_dir_structure()
-    install_jb()
-    install_tanka()
+    present = _tools_on_path()
+    missing = [name for name in BINARY_INSTALLERS if name not in present]
+    for name in BINARY_INSTALLERS:
+        if name not in missing:
+            install_bin(name)  # reports that it is already present
+    if missing:
+        # Prompt for the sudo password once, so the parallel installs don't
+        # race for the terminal.
+        run(["sudo", "-v"], interactive=True)
+        with ThreadPoolExecutor(max_workers=len(missing)) as ex:
+            futures = [ex.submit(install_bin, name) for name in missing]
+            for f in futures:
+                f.result()
     validate_tools()
-    deps_update()
-    deps_vendor()
+    # jb vendors into vendor/ and tk into charts/, so both can run at once.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [ex.submit(deps_update, tag="jb"), ex.submit(deps_vendor, tag="tk")]
+        for f in futures:
+            f.result()
     info("Initialized deployment setup.")
 
 
@@ -537,59 +657,69 @@ def hard_init():
 # ---------------------------
 
 
-def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description="Wisefood Deployment Control Tool")
-    sub = parser.add_subparsers(dest="cmd", required=True)
+class _LazySubParsersAction(argparse._SubParsersAction):
+    """Subparsers action that only builds the parser of the selected command."""
 
-    # sample
-    p_sample = sub.add_parser(
-        "sample", help="Generate a sample YAML configuration file"
-    )
-    p_sample.add_argument(
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._builders = {}
+
+    def add_lazy_parser(self, name: str, help: str, builder):
+        # Register the name and help line only; the parser itself is built on demand.
+        self._builders[name] = builder
+        self._choices_actions.append(self._ChoicesPseudoAction(name, (), help))
+        self._name_parser_map[name] = None
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name = values[0]
+        if name in self._builders:
+            del self._name_parser_map[name]
+            self._builders.pop(name)(self.add_parser(name))
+        super().__call__(parser, namespace, values, option_string)
+
+
+def _build_sample(p: argparse.ArgumentParser):
+    p.add_argument(
         "-o",
         "--output",
         default="example_config.yaml",
         help="Output file path (default: example_config.yaml)",
     )
-    p_sample.set_defaults(func=lambda args: generate_sample_yaml(file_path=args.output))
+    p.set_defaults(func=lambda args: generate_sample_yaml(file_path=args.output))
 
-    # init
-    p_init = sub.add_parser(
-        "init", help="Initialize directory structure and install dependencies"
-    )
-    p_init.set_defaults(func=lambda args: (hard_init()))
 
-    # validate
-    p_validate = sub.add_parser("validate", help="Validate tools and repo structure")
-    p_validate.set_defaults(func=lambda args: validate_setup())
+def _build_init(p: argparse.ArgumentParser):
+    p.set_defaults(func=lambda args: (hard_init()))
+
+
+def _build_validate(p: argparse.ArgumentParser):
+    p.set_defaults(func=lambda args: validate_setup())
+
 
-    # list envs
-    p_list = sub.add_parser("list", help="List available Tanka environments")
-    p_list.set_defaults(
+def _build_list(p: argparse.ArgumentParser):
+    p.set_defaults(
         func=lambda args: print("\n".join(list_envs()) or "(no environments)")
     )
 
-    # create environment
-    p_deploy = sub.add_parser(
-        "env", help="Build an environment based on an input YAML file"
-    )
-    p_deploy.add_argument(
+
+def _build_env(p: argparse.ArgumentParser):
+    p.add_argument(
         "config_file", help="Path to deployment configuration file (.yaml or .yml)"
     )
-    p_deploy.add_argument(
+    p.add_argument(
         "--force",
         action="store_true",
         help="Force environment creation, overwriting existing files",
     )
-    p_deploy.set_defaults(
+    p.set_defaults(
         func=lambda args: create_env(
             config_yaml_path=args.config_file, force=args.force
         )
     )
 
-    # deps
-    p_deps = sub.add_parser("deps", help="Manage Jsonnet/Helm chart dependencies")
-    dsub = p_deps.add_subparsers(dest="deps_cmd", required=True)
+
+def _build_deps(p: argparse.ArgumentParser):
+    dsub = p.add_subparsers(dest="deps_cmd", required=True)
     dsub.add_parser("update", help="Run 'jb update'").set_defaults(
         func=lambda a: deps_update()
     )
@@ -597,23 +727,43 @@ def build_parser() -> argparse.ArgumentParser:
         func=lambda a: deps_vendor()
     )
 
-    # install
-    p_install = sub.add_parser("install", help="Install tooling (requires sudo)")
-    isub = p_install.add_subparsers(dest="tool", required=True)
+
+def _build_install(p: argparse.ArgumentParser):
+    isub = p.add_subparsers(dest="tool", required=True)
 
     it = isub.add_parser("tanka", help="Install Grafana Tanka")
     it.add_argument("--force", action="store_true")
     it.add_argument("--dest", default="/usr/local/bin/tk")
-    it.set_defaults(func=lambda a: install_tanka(dest=a.dest, force=a.force))
+    it.set_defaults(func=lambda a: install_bin("tk", dest=a.dest, force=a.force))
 
     ij = isub.add_parser("jb", help="Install Jsonnet Bundler")
     ij.add_argument("--force", action="store_true")
     ij.add_argument("--dest", default="/usr/local/bin/jb")
-    ij.set_defaults(func=lambda a: install_jb(dest=a.dest, force=a.force))
+    ij.set_defaults(func=lambda a: install_bin("jb", dest=a.dest, force=a.force))
 
     ih = isub.add_parser("helm", help="Install Helm 3")
     ih.set_defaults(func=lambda a: install_helm())
 
+
+# command name -> (help string, parser builder)
+COMMANDS = {
+    "sample": ("Generate a sample YAML configuration file", _build_sample),
+    "init": ("Initialize directory structure and install dependencies", _build_init),
+    "validate": ("Validate tools and repo structure", _build_validate),
+    "list": ("List available Tanka environments", _build_list),
+    "env": ("Build an environment based on an input YAML file", _build_env),
+    "deps": ("Manage Jsonnet/Helm chart dependencies", _build_deps),
+    "install": ("Install tooling (requires sudo)", _build_install),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Wisefood Deployment Control Tool")
+    sub = parser.add_subparsers(
+        dest="cmd", required=True, action=_LazySubParsersAction
+    )
+    for name, (help_text, builder) in COMMANDS.items():
+        sub.add_lazy_parser(name, help=help_text, builder=builder)
     return parser
 
 